@@ -6,52 +6,115 @@ import asyncio
 import os
 import re
 import sys
+from collections import Counter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from functools import lru_cache
+from html import unescape
 from pathlib import Path
 from typing import Optional
-from urllib.parse import urljoin, urldefrag, urlparse, unquote
+from urllib.parse import quote, urljoin, urldefrag, urlparse, urlsplit, unquote
 
-import aiofiles
 import aiohttp
-from bs4 import BeautifulSoup
+import lxml.etree
 
 try:
     from aiohttp_socks import ProxyConnector
 except Exception:
     ProxyConnector = None
 
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except Exception:
+    LexborHTMLParser = None
 
-ONION_RE = re.compile(r"^https?://[a-z2-7]{16,56}\.onion(?:/.*)?$", re.I)
-
+try:
+    import uvloop
+except Exception:
+    uvloop = None
 
-@dataclass
+try:
+    from orjson import loads as json_loads
+except Exception:
+    from json import loads as json_loads
+
+
+# re.A: with re.I alone, [a-z] would also accept non-ASCII case variants (e.g. the Kelvin sign)
+ONION_RE = re.compile(r"https?://[a-z2-7]{16,56}\.onion(?:/.*)?", re.I | re.A)
+SKIP_HREF_RE = re.compile(r"^\s*(?:#|javascript:|mailto:)", re.I)
+CD_FILENAME_RE = re.compile(r'filename=\s*(?:"([^"]*)"|([^;]*))', re.I)
+# autoindex fast path: nginx/Apache/lighttpd "Index of /" pages are flat <a href> lists inside <pre>;
+# both the generated <title> and the <pre> must be there, so ordinary pages still get a real parser
+AUTOINDEX_RE = re.compile(r"<title>\s*Index of\b", re.I)
+# quoted or bare attribute value
+HREF_RE = re.compile(r"""<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.I)
+# dir_score: path segments are split into words on anything that is not a letter or digit
+WORD_SPLIT_RE = re.compile(r"[^0-9a-z]+")
+# Range replies: "bytes <first>-<last>/<total>"
+CONTENT_RANGE_RE = re.compile(r"\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$", re.I)
+# url_key: runs of slashes, and %XX escapes
+SLASH_RUN_RE = re.compile(r"/{2,}")
+PCT_ESCAPE_RE = re.compile(r"%([0-9A-Fa-f]{2})")
+# RFC 3986 unreserved characters: %-escaping them does not change the URL
+UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+# HTML is fed to the lxml fallback parser in slices of this many characters
+PARSE_CHUNK = 64 * 1024
+
+# connection pool size for make_session
+CONN_LIMIT = 32
+CONN_LIMIT_PER_HOST = 16
+
+# download streaming: network read size and how much is buffered before each disk write
+READ_CHUNK = 256 * 1024
+WRITE_BUFFER = 1024 * 1024
+
+# large files (known size, server accepts ranges) are split into this many parallel Range requests
+RANGE_MIN_BYTES = 8 * 1024 * 1024
+RANGE_PARTS = 4
+
+# os.writev/os.pwritev are POSIX-only: elsewhere write_all falls back to plain writes and
+# ranged downloads are off (parts need positional writes into one shared fd)
+VECTOR_IO = hasattr(os, "writev") and hasattr(os, "pwritev")
+# O_BINARY keeps Windows from translating newlines in the downloaded bytes (0 on POSIX)
+OPEN_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+
+@dataclass(slots=True)
 class Settings:
     tor_proxy: str
     timeout: int = 60
     max_mb: int = 150
-    allow_ext: set[str] = None  # type: ignore
+    allow_ext: frozenset[str] = None  # type: ignore
     max_files: int = 300
     max_depth: int = 2
+    concurrency: int = 8
+    dl_concurrency: int = 4
+    # connections the session must hold at peak; 0 = derive from concurrency / dl_concurrency
+    conn_limit: int = 0
     user_agent: str = "Mozilla/5.0 (compatible; DWBot/1.0)"
 
     def __post_init__(self):
         if self.allow_ext is None:
-            self.allow_ext = {
+            self.allow_ext = frozenset({
                 "pdf", "txt", "jpg", "jpeg", "png", "zip",
                 "mp4", "mkv", "avi", "webm", "mov"
-            }
+            })
+        else:
+            self.allow_ext = frozenset(self.allow_ext)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FileItem:
     url: str
     name: str
     ext: str
-    path_parts: tuple[str, ...]
 
 
+@lru_cache(maxsize=4096)
 def is_onion_url(url: str) -> bool:
-    return bool(ONION_RE.match(url.strip()))
+    return ONION_RE.fullmatch(url.strip()) is not None
 
 
 def normalize_proxy(proxy: str) -> str:
@@ -61,6 +124,7 @@ def normalize_proxy(proxy: str) -> str:
     return p
 
 
+@lru_cache(maxsize=4096)
 def norm_ext(name: str) -> str:
     name = name.strip().lower()
     if "." not in name:
@@ -69,15 +133,7 @@ def norm_ext(name: str) -> str:
 
 
 def should_skip_href(href: str) -> bool:
-    if not href:
-        return True
-    href = href.strip()
-    if href.startswith("#"):
-        return True
-    h = href.lower()
-    if h.startswith("javascript:") or h.startswith("mailto:"):
-        return True
-    return False
+    return not href or SKIP_HREF_RE.match(href) is not None
 
 
 def safe_join(base_url: str, href: str) -> str:
@@ -89,13 +145,36 @@ def looks_like_directory_path(path: str) -> bool:
     return path.endswith("/")
 
 
-def url_path_parts(url: str) -> tuple[str, ...]:
-    p = urlparse(url).path.strip("/")
+@lru_cache(maxsize=4096)
+def path_parts(path: str) -> tuple[str, ...]:
+    p = path.strip("/")
     if not p:
         return tuple()
     return tuple(x for x in p.split("/") if x)
 
 
+@lru_cache(maxsize=4096)
+def url_path_parts(url: str) -> tuple[str, ...]:
+    return path_parts(urlparse(url).path)
+
+
+def pct_normalize(m: re.Match) -> str:
+    ch = chr(int(m[1], 16))
+    return ch if ch in UNRESERVED else f"%{m[1].upper()}"
+
+
+@lru_cache(maxsize=8192)
+def url_key(url: str) -> str:
+    # dedup key: host case, %-escapes and doubled slashes do not make a different page
+    # only escapes of unreserved characters are decoded (others just upper-cased), so a%2Fb stays apart from a/b;
+    # urlsplit keeps ";params" in the path
+    u = urlsplit(url)
+    path = PCT_ESCAPE_RE.sub(pct_normalize, u.path)
+    path = SLASH_RUN_RE.sub("/", path) or "/"
+    key = f"{u.scheme.lower()}://{u.netloc.lower()}{path}"
+    return f"{key}?{u.query}" if u.query else key
+
+
 def bytes_to_human(n: int) -> str:
     units = ["B", "KB", "MB", "GB", "TB"]
     x = float(n)
@@ -112,65 +191,152 @@ def make_session(settings: Settings) -> aiohttp.ClientSession:
     headers = {"User-Agent": settings.user_agent}
     timeout = aiohttp.ClientTimeout(total=settings.timeout)
 
+    # explicit pool limits: the crawl/download fan-out mostly targets a single onion host;
+    # idle connections are kept alive so follow-up requests reuse the established Tor stream.
+    # The pool must cover peak demand (each ranged download holds RANGE_PARTS connections):
+    # ClientTimeout.total also counts time spent waiting for a free slot
+    demand = settings.conn_limit or max(settings.concurrency, settings.dl_concurrency * RANGE_PARTS)
+    pool = dict(
+        limit=max(CONN_LIMIT, demand),
+        limit_per_host=max(CONN_LIMIT_PER_HOST, demand),
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+    )
+
     proxy = normalize_proxy(settings.tor_proxy)
     if proxy:
         if not ProxyConnector:
             raise RuntimeError("aiohttp-socks kerak: pip install aiohttp-socks")
-        connector = ProxyConnector.from_url(proxy)
-        return aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector)
+        # rdns: .onion names can only be resolved inside Tor, never locally
+        connector = ProxyConnector.from_url(proxy, rdns=True, **pool)
+    else:
+        connector = aiohttp.TCPConnector(**pool)
+
+    return aiohttp.ClientSession(headers=headers, timeout=timeout, connector=connector)
 
-    return aiohttp.ClientSession(headers=headers, timeout=timeout)
 
+@asynccontextmanager
+async def session_scope(settings: Settings, session: Optional[aiohttp.ClientSession] = None) -> AsyncIterator[aiohttp.ClientSession]:
+    # reuse the caller's session (and its warm connection pool) when given, else open a private one
+    if session is not None:
+        yield session
+        return
+    async with make_session(settings) as s:
+        yield s
 
-async def fetch_text(session: aiohttp.ClientSession, url: str) -> str:
+
+async def fetch_listing(session: aiohttp.ClientSession, url: str) -> tuple[str, str]:
+    # returns (content type, body) so JSON indexes can skip the HTML parser
     async with session.get(url, allow_redirects=True) as resp:
         resp.raise_for_status()
-        return await resp.text(errors="ignore")
+        return resp.content_type, await resp.text(errors="ignore")
+
+
+def extract_hrefs(html: str) -> list[str]:
+    # generated directory listings need no HTML tree: one regex scan pulls every href
+    head = html[:4096]
+    if AUTOINDEX_RE.search(head) and "<pre" in head.lower():
+        hrefs = [dq or sq or bare for dq, sq, bare in HREF_RE.findall(html)]
+        if hrefs:
+            return [unescape(h) if "&" in h else h for h in hrefs]
+        # nothing matched: not the flat listing we expected, fall through to the parser
+
+    # selectolax (lexbor) is much faster for plain <a href> extraction; lxml is the fallback
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(html)
+        return [a.attributes.get("href") or "" for a in tree.css("a[href]")]
+
+    if not html:
+        return []
+
+    # incremental parse: each <a> (and the siblings before it) is dropped once read to keep the tree small
+    parser = lxml.etree.HTMLPullParser(events=("end",), tag="a")
+    hrefs: list[str] = []
+
+    def drain() -> None:
+        for _, el in parser.read_events():
+            href = el.get("href")
+            if href is not None:
+                hrefs.append(href)
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+    for i in range(0, len(html), PARSE_CHUNK):
+        parser.feed(html[i:i + PARSE_CHUNK])
+        drain()
+    try:
+        parser.close()
+    except lxml.etree.LxmlError:
+        pass
+    drain()
+    return hrefs
 
 
 def parse_links(html: str, base_url: str) -> list[str]:
-    soup = BeautifulSoup(html, "lxml")
+    # dict.fromkeys de-dups in C and keeps first-seen order
+    return list(dict.fromkeys(
+        safe_join(base_url, href) for href in extract_hrefs(html) if not should_skip_href(href)
+    ))
+
+
+def parse_json_index(body: str, base_url: str) -> list[str]:
+    # nginx "autoindex_format json": [{"name": ..., "type": "directory" | "file", ...}, ...]
+    try:
+        entries = json_loads(body)
+    except ValueError:
+        return []
+    if not isinstance(entries, list):
+        return []
     out: list[str] = []
-    for a in soup.find_all("a"):
-        href = a.get("href", "")
-        if should_skip_href(href):
+    for e in entries:
+        if not isinstance(e, dict) or not e.get("name"):
             continue
-        out.append(safe_join(base_url, href))
-    # de-dup
-    seen = set()
-    dedup = []
-    for u in out:
-        if u not in seen:
-            seen.add(u)
-            dedup.append(u)
-    return dedup
+        href = quote(str(e["name"]))
+        if e.get("type") == "directory":
+            href += "/"
+        out.append(urljoin(base_url, href))
+    return out
+
+
+def parse_listing(content_type: str, body: str, base_url: str) -> list[str]:
+    if "json" in content_type:
+        return parse_json_index(body, base_url)
+    return parse_links(body, base_url)
 
 
 def is_allowed_ext(ext: str, settings: Settings) -> bool:
-    if not ext:
-        return False
-    return ext.lower() in settings.allow_ext
+    # ext comes from norm_ext, which already lowercases
+    return bool(ext) and ext in settings.allow_ext
 
 
-def guess_name_from_url(url: str) -> str:
-    p = urlparse(url).path
+def filter_allowed(files: list[FileItem], settings: Settings) -> list[FileItem]:
+    # crawled files always have a non-empty ext, so a plain frozenset lookup is enough
+    allow = settings.allow_ext
+    return [f for f in files if f.ext in allow]
+
+
+@lru_cache(maxsize=4096)
+def name_from_path(p: str) -> str:
     if not p or p.endswith("/"):
         return "file"
     name = p.rstrip("/").split("/")[-1] or "file"
     return unquote(name)
 
 
+@lru_cache(maxsize=4096)
+def guess_name_from_url(url: str) -> str:
+    return name_from_path(urlparse(url).path)
+
+
 def parse_filename_from_content_disposition(cd: str) -> Optional[str]:
     if not cd:
         return None
-    cd_low = cd.lower()
-    if "filename=" not in cd_low:
+    m = CD_FILENAME_RE.search(cd)
+    if not m:
         return None
-    part = cd.split("filename=", 1)[-1].strip()
-    if part.startswith('"') and '"' in part[1:]:
-        part = part.split('"', 2)[1]
-    else:
-        part = part.split(";", 1)[0].strip().strip('"').strip("'")
+    quoted, bare = m.groups()
+    part = quoted if quoted is not None else bare.strip().strip('"').strip("'")
     part = part.strip()
     return part or None
 
@@ -187,9 +353,23 @@ async def head_info(session: aiohttp.ClientSession, url: str) -> tuple[Optional[
         return None, "", ""
 
 
+def is_html_type(ct: str) -> bool:
+    return ("text/html" in ct) or ("application/xhtml" in ct)
+
+
 async def is_probably_html(session: aiohttp.ClientSession, url: str) -> bool:
     _, ct, _ = await head_info(session, url)
-    return ("text/html" in ct) or ("application/xhtml" in ct)
+    return is_html_type(ct)
+
+
+def dir_score(url: str, settings: Settings) -> int:
+    # +1 per path segment that has an allowed extension as a whole word, e.g. /videos_mp4/ or /pdf/
+    # (whole tokens only: a substring test would let "avi" match /navigation/ and "mov" match /remove/)
+    score = 0
+    for part in url_path_parts(url):
+        if not settings.allow_ext.isdisjoint(WORD_SPLIT_RE.split(unquote(part).lower())):
+            score += 1
+    return score
 
 
 async def crawl_directory(session: aiohttp.ClientSession, root_url: str, settings: Settings) -> list[FileItem]:
@@ -198,56 +378,211 @@ async def crawl_directory(session: aiohttp.ClientSession, root_url: str, setting
         root_url += "/"
 
     host = urlparse(root_url).netloc.lower()
+    sem = asyncio.Semaphore(settings.concurrency)
 
-    visited_dirs: set[str] = set()
-    q: list[tuple[str, int]] = [(root_url, 0)]
-    files: list[FileItem] = []
-
-    while q and len(files) < settings.max_files:
-        cur, depth = q.pop(0)
-        if depth > settings.max_depth:
-            continue
-        if not cur.endswith("/"):
-            cur += "/"
-        if cur in visited_dirs:
-            continue
-        visited_dirs.add(cur)
+    async def fetch_dir(url: str) -> tuple[str, str]:
+        async with sem:
+            return await fetch_listing(session, url)
 
-        try:
-            html = await fetch_text(session, cur)
-        except Exception:
-            continue
+    # directories are marked visited (by url_key) when queued, so a level never holds duplicates or revisits
+    visited_dirs: set[str] = {url_key(root_url)}
+    seen_files: set[str] = set()
+    current_level: list[str] = [root_url]
+    files: list[FileItem] = []
+    depth = 0
 
-        links = parse_links(html, cur)
+    # level-synchronous BFS: every directory of one depth is fetched concurrently
+    while current_level and depth <= settings.max_depth and len(files) < settings.max_files:
+        pages = await asyncio.gather(*(fetch_dir(u) for u in current_level), return_exceptions=True)
 
-        for link in links:
+        next_level: list[str] = []
+        for cur, page in zip(current_level, pages):
             if len(files) >= settings.max_files:
                 break
-
-            u = urlparse(link)
-            if u.netloc.lower() != host:
-                continue
-            if u.path.rstrip("/").endswith(".."):
+            if isinstance(page, BaseException):
                 continue
 
-            if looks_like_directory_path(u.path):
-                if depth + 1 <= settings.max_depth:
-                    q.append((link, depth + 1))
-                continue
+            # parse off the event loop so a huge listing does not stall the other in-flight requests
+            links = await asyncio.to_thread(parse_listing, *page, cur)
+
+            for link in links:
+                if len(files) >= settings.max_files:
+                    break
+
+                u = urlparse(link)
+                if u.netloc.lower() != host:
+                    continue
+                if u.path.rstrip("/").endswith(".."):
+                    continue
+
+                if looks_like_directory_path(u.path):
+                    key = url_key(link)
+                    if depth + 1 <= settings.max_depth and key not in visited_dirs:
+                        visited_dirs.add(key)
+                        next_level.append(link)
+                    continue
+
+                # reuse the parsed link instead of re-parsing it
+                name = name_from_path(u.path)
+                ext = norm_ext(name)
+                if not ext:
+                    # directory mode: ignore "download?id=..."
+                    continue
+
+                # mirrored listings link the same file from several pages
+                key = url_key(link)
+                if key in seen_files:
+                    continue
+                seen_files.add(key)
+
+                files.append(FileItem(url=link, name=name, ext=ext))
+
+        # focused crawl: directories that look like they hold allowed files are fetched and read first,
+        # so they win when max_files cuts the crawl short (stable sort keeps listing order on ties)
+        next_level.sort(key=lambda link: -dir_score(link, settings))
+        current_level = next_level
+        depth += 1
 
-            name = guess_name_from_url(link)
-            ext = norm_ext(name)
-            if not ext:
-                # directory mode: ignore "download?id=..."
-                continue
+    return files
 
-            files.append(FileItem(url=link, name=name, ext=ext, path_parts=url_path_parts(link)))
 
-    return files
+def write_all(fd: int, bufs: list[bytes], offset: Optional[int] = None) -> None:
+    # one writev syscall for the whole batch (pwritev at offset when given); finish with os.write if it came up short
+    if not VECTOR_IO:
+        # sequential writes only: offsets come from ranged downloads, which are off without VECTOR_IO
+        rest = memoryview(b"".join(bufs))
+        while rest:
+            rest = rest[os.write(fd, rest):]
+        return
+    total = sum(len(b) for b in bufs)
+    written = os.writev(fd, bufs) if offset is None else os.pwritev(fd, bufs, offset)
+    if written < total:
+        rest = memoryview(b"".join(bufs))[written:]
+        while rest:
+            if offset is None:
+                n = os.write(fd, rest)
+            else:
+                n = os.pwrite(fd, rest, offset + written)
+                written += n
+            rest = rest[n:]
+
+
+async def write_batch(fd: int, bufs: list[bytes], offset: Optional[int] = None) -> None:
+    # cancelling the await does not stop a write already running on the executor thread, so on
+    # cancellation keep waiting for it: the caller must not close the fd (and free its number) under it
+    fut = asyncio.get_running_loop().run_in_executor(None, write_all, fd, bufs, offset)
+    try:
+        await asyncio.shield(fut)
+    except asyncio.CancelledError:
+        while not fut.done():
+            try:
+                await asyncio.wait([fut])
+            except asyncio.CancelledError:
+                pass
+        raise
 
 
-async def download_direct_file(session: aiohttp.ClientSession, url: str, out_dir: Path, settings: Settings) -> str:
-    size, ct, cd = await head_info(session, url)
+async def stream_to_file(resp: aiohttp.ClientResponse, out_path: Path, max_bytes: int) -> tuple[int, bool]:
+    # returns (bytes read, exceeded); on exceeded the partial file is left for the caller to remove
+    fd = os.open(out_path, OPEN_FLAGS, 0o644)
+    downloaded = 0
+    pending: list[bytes] = []
+    pending_len = 0
+    try:
+        async for chunk in resp.content.iter_chunked(READ_CHUNK):
+            if not chunk:
+                continue
+            downloaded += len(chunk)
+            if downloaded > max_bytes:
+                # drop the connection now instead of letting the context exit deal with an unread body
+                resp.close()
+                return downloaded, True
+            pending.append(chunk)
+            pending_len += len(chunk)
+            # batch chunks so the thread-pool hop happens once per WRITE_BUFFER, not per chunk
+            # (the count cap keeps a run of tiny chunks under the writev IOV_MAX limit)
+            if pending_len >= WRITE_BUFFER or len(pending) >= 256:
+                await write_batch(fd, pending)
+                pending = []
+                pending_len = 0
+        if pending:
+            await write_batch(fd, pending)
+        return downloaded, False
+    finally:
+        os.close(fd)
+
+
+async def stream_range(resp: aiohttp.ClientResponse, fd: int, start: int, end: int) -> int:
+    # writes the body into [start, end) of fd; stops (and drops the connection) at end; returns bytes written
+    pos = start
+    pending: list[bytes] = []
+    pending_len = 0
+    async for chunk in resp.content.iter_chunked(READ_CHUNK):
+        if not chunk:
+            continue
+        chunk = chunk[:end - pos - pending_len]
+        pending.append(chunk)
+        pending_len += len(chunk)
+        if pos + pending_len >= end:
+            resp.close()
+            break
+        if pending_len >= WRITE_BUFFER or len(pending) >= 256:
+            await write_batch(fd, pending, pos)
+            pos += pending_len
+            pending = []
+            pending_len = 0
+    if pending:
+        await write_batch(fd, pending, pos)
+        pos += pending_len
+    return pos - start
+
+
+async def download_ranged(session: aiohttp.ClientSession, resp: aiohttp.ClientResponse, url: str, size: int, out_path: Path) -> int:
+    # resp (the plain GET already in flight) supplies the first part; the rest are fetched
+    # in parallel with Range requests, each on its own pooled connection
+    bounds = [size * i // RANGE_PARTS for i in range(RANGE_PARTS + 1)]
+
+    fd = os.open(out_path, OPEN_FLAGS, 0o644)
+    try:
+        os.ftruncate(fd, size)
+
+        async def part(lo: int, hi: int) -> int:
+            headers = {"Range": f"bytes={lo}-{hi - 1}", "Accept-Encoding": "identity"}
+            async with session.get(url, headers=headers, allow_redirects=True) as r:
+                if r.status != 206:
+                    raise RuntimeError(f"Range not honored (HTTP {r.status})")
+                # the server must send exactly the window asked for, or the bytes land at the wrong offset
+                cr = CONTENT_RANGE_RE.match(r.headers.get("Content-Range", ""))
+                if not cr or (int(cr[1]), int(cr[2]), cr[3]) != (lo, hi - 1, str(size)):
+                    raise RuntimeError(f"Unexpected Content-Range: {r.headers.get('Content-Range')!r}")
+                return await stream_range(r, fd, lo, hi)
+
+        try:
+            # TaskGroup cancels the sibling parts if one fails and waits for them to finish; each part
+            # settles its in-flight write first, so the fd is only closed once no thread is writing to it
+            async with asyncio.TaskGroup() as tg:
+                tasks = [tg.create_task(stream_range(resp, fd, bounds[0], bounds[1]))]
+                tasks += [tg.create_task(part(bounds[i], bounds[i + 1])) for i in range(1, RANGE_PARTS)]
+        except ExceptionGroup as eg:
+            raise eg.exceptions[0] from None
+
+        got = sum(t.result() for t in tasks)
+        if got != size:
+            raise RuntimeError(f"Incomplete ranged download: {got}/{size} bytes")
+        return got
+    finally:
+        os.close(fd)
+
+
+async def download_direct_file(
+    session: aiohttp.ClientSession,
+    url: str,
+    out_dir: Path,
+    settings: Settings,
+    info: Optional[tuple[Optional[int], str, str]] = None,
+) -> str:
+    # info: head_info() result the caller already has, to avoid a second HEAD to the same URL
+    size, ct, cd = info if info is not None else await head_info(session, url)
 
     fname = parse_filename_from_content_disposition(cd) or guess_name_from_url(url)
     if not fname:
@@ -264,23 +599,16 @@ async def download_direct_file(session: aiohttp.ClientSession, url: str, out_dir
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / fname
 
-    downloaded = 0
     try:
         async with session.get(url, allow_redirects=True) as resp:
             resp.raise_for_status()
-            async with aiofiles.open(out_path, "wb") as f:
-                async for chunk in resp.content.iter_chunked(64 * 1024):
-                    if not chunk:
-                        continue
-                    downloaded += len(chunk)
-                    if downloaded > max_bytes:
-                        await f.close()
-                        try:
-                            out_path.unlink(missing_ok=True)
-                        except Exception:
-                            pass
-                        return f"❌ Exceeded limit while downloading. Stopped at {bytes_to_human(downloaded)}"
-                    await f.write(chunk)
+            downloaded, exceeded = await stream_to_file(resp, out_path, max_bytes)
+        if exceeded:
+            try:
+                out_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            return f"❌ Exceeded limit while downloading. Stopped at {bytes_to_human(downloaded)}"
         return f"✅ Direct file downloaded: {fname} ({bytes_to_human(downloaded)})\nSaved to: {out_dir}"
     except Exception as e:
         try:
@@ -290,13 +618,68 @@ async def download_direct_file(session: aiohttp.ClientSession, url: str, out_dir
         return f"❌ Download failed: {e}"
 
 
-async def mode_list(root_url: str, settings: Settings, limit: int = 50) -> str:
-    async with make_session(settings) as session:
+async def download_one(session: aiohttp.ClientSession, fi: FileItem, out_root: Path, settings: Settings) -> tuple[str, str]:
+    # returns (status, log line); status is one of ok / skip / fail
+    name = fi.name
+    # path parts are only needed for files that actually get downloaded, so derive them here
+    parts = url_path_parts(fi.url)
+    rel_dir = out_root.joinpath(*parts[:-1]) if len(parts) > 1 else out_root
+    rel_dir.mkdir(parents=True, exist_ok=True)
+    out_path = rel_dir / name
+
+    max_bytes = settings.max_mb * 1024 * 1024
+
+    try:
+        async with session.get(fi.url, allow_redirects=True) as resp:
+            resp.raise_for_status()
+            # size gate from the GET headers: saves a separate HEAD round-trip over Tor
+            cl = resp.headers.get("Content-Length")
+            size = int(cl) if cl and cl.isdigit() else None
+            if size is not None and size > max_bytes:
+                resp.close()
+                return "skip", f"SKIP too large: {name} ({bytes_to_human(size)})"
+            ranged = (
+                VECTOR_IO
+                and size is not None
+                and size >= RANGE_MIN_BYTES
+                and resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+                and not resp.headers.get("Content-Encoding")
+            )
+            if ranged:
+                try:
+                    downloaded, exceeded = await download_ranged(session, resp, fi.url, size, out_path), False
+                except Exception:
+                    # server advertised ranges but did not serve them properly: redo it as one plain GET
+                    resp.close()
+                    async with session.get(fi.url, allow_redirects=True) as retry:
+                        retry.raise_for_status()
+                        downloaded, exceeded = await stream_to_file(retry, out_path, max_bytes)
+            else:
+                downloaded, exceeded = await stream_to_file(resp, out_path, max_bytes)
+
+        if exceeded:
+            try:
+                out_path.unlink(missing_ok=True)
+            except Exception:
+                pass
+            return "skip", f"SKIP exceeded limit: {name}"
+        return "ok", f"OK {name} ({bytes_to_human(downloaded)})"
+
+    except Exception as e:
+        try:
+            out_path.unlink(missing_ok=True)
+        except Exception:
+            pass
+        return "fail", f"FAIL {name}: {e}"
+
+
+async def mode_list(root_url: str, settings: Settings, limit: int = 50, session: Optional[aiohttp.ClientSession] = None) -> str:
+    async with session_scope(settings, session) as session:
         if not root_url.endswith("/") and not await is_probably_html(session, root_url):
             return f"Direct file link:\n{root_url}"
 
         files = await crawl_directory(session, root_url, settings)
-        allowed = [f for f in files if is_allowed_ext(f.ext, settings)]
+        allowed = filter_allowed(files, settings)
 
         if not allowed:
             return "Allowed files: 0/0\n(Directory listing topilmadi yoki ext filtr sabab.)"
@@ -311,108 +694,99 @@ async def mode_list(root_url: str, settings: Settings, limit: int = 50) -> str:
         return f"Direct links ({min(limit, len(allowed))}/{len(allowed)}):\n\n" + "\n\n".join(lines) + more
 
 
-async def mode_count(root_url: str, ext: Optional[str], settings: Settings) -> str:
-    async with make_session(settings) as session:
+async def mode_count(root_url: str, ext: Optional[str], settings: Settings, session: Optional[aiohttp.ClientSession] = None) -> str:
+    async with session_scope(settings, session) as session:
         if not root_url.endswith("/") and not await is_probably_html(session, root_url):
             return "This is a direct file link (not a directory). Use /download."
 
         files = await crawl_directory(session, root_url, settings)
-        allowed = [f for f in files if is_allowed_ext(f.ext, settings)]
+        allowed = filter_allowed(files, settings)
 
         if ext:
             e = ext.strip().lower().lstrip(".")
             return f"Count .{e}: {sum(1 for f in allowed if f.ext == e)}"
 
-        counts: dict[str, int] = {}
-        for f in allowed:
-            counts[f.ext] = counts.get(f.ext, 0) + 1
+        counts = Counter(f.ext for f in allowed)
 
         parts = [f"Allowed files: {len(allowed)}/{len(files)}"]
-        for k in sorted(counts, key=lambda x: (-counts[x], x)):
-            parts.append(f"{k}: {counts[k]}")
+        for k, v in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+            parts.append(f"{k}: {v}")
         return "\n".join(parts)
 
 
-async def mode_size(root_url: str, settings: Settings) -> str:
-    async with make_session(settings) as session:
-        if not root_url.endswith("/") and not await is_probably_html(session, root_url):
-            size, ct, cd = await head_info(session, root_url)
+async def mode_size(root_url: str, settings: Settings, session: Optional[aiohttp.ClientSession] = None) -> str:
+    async with session_scope(settings, session) as session:
+        # one HEAD answers both "is this a listing?" and the direct file's size
+        info = await head_info(session, root_url) if not root_url.endswith("/") else None
+        if info is not None and not is_html_type(info[1]):
+            size, ct, cd = info
             fname = parse_filename_from_content_disposition(cd) or guess_name_from_url(root_url)
             s = bytes_to_human(size) if size is not None else "unknown"
             return f"Direct file: {fname}\nSize: {s}\nType: {ct or 'unknown'}"
 
         files = await crawl_directory(session, root_url, settings)
-        allowed = [f for f in files if is_allowed_ext(f.ext, settings)]
-        return f"Allowed files (size mode): {len(allowed)}/{len(files)}"
+        allowed = filter_allowed(files, settings)
 
+        sem = asyncio.Semaphore(settings.concurrency)
 
-async def mode_download(root_url: str, out_dir: str, settings: Settings) -> str:
+        async def probe(fi: FileItem) -> Optional[int]:
+            async with sem:
+                size, _, _ = await head_info(session, fi.url)
+                return size
+
+        sizes = await asyncio.gather(*(probe(f) for f in allowed))
+        total = sum(s for s in sizes if s is not None)
+        unknown = sum(1 for s in sizes if s is None)
+
+        return (
+            f"Allowed files (size mode): {len(allowed)}/{len(files)}\n"
+            f"Total size: {bytes_to_human(total)}"
+            + (f" (+{unknown} unknown)" if unknown else "")
+        )
+
+
+async def mode_download(root_url: str, out_dir: str, settings: Settings, session: Optional[aiohttp.ClientSession] = None) -> str:
     out_root = Path(out_dir).resolve()
     out_root.mkdir(parents=True, exist_ok=True)
 
-    async with make_session(settings) as session:
-        # ✅ direct file
-        if not root_url.endswith("/") and not await is_probably_html(session, root_url):
-            return await download_direct_file(session, root_url, out_root, settings)
+    async with session_scope(settings, session) as session:
+        # ✅ direct file (the HEAD used for detection is handed on, not repeated)
+        info = await head_info(session, root_url) if not root_url.endswith("/") else None
+        if info is not None and not is_html_type(info[1]):
+            return await download_direct_file(session, root_url, out_root, settings, info=info)
 
         # ✅ directory
         files = await crawl_directory(session, root_url, settings)
-        allowed = [f for f in files if is_allowed_ext(f.ext, settings)]
+        allowed = filter_allowed(files, settings)
 
-        ok = 0
-        skip = 0
-        fail = 0
-        logs: list[str] = []
+        queue: asyncio.Queue[tuple[int, FileItem]] = asyncio.Queue()
+        for item in enumerate(allowed):
+            queue.put_nowait(item)
 
-        max_bytes = settings.max_mb * 1024 * 1024
+        # results are stored by crawl position so the report order does not depend on which download finished first
+        results: list[tuple[str, str]] = [("fail", "")] * len(allowed)
 
-        for fi in allowed:
-            name = fi.name
-            rel_dir = out_root.joinpath(*fi.path_parts[:-1]) if len(fi.path_parts) > 1 else out_root
-            rel_dir.mkdir(parents=True, exist_ok=True)
-            out_path = rel_dir / name
-
-            # size gate
-            size, _, _ = await head_info(session, fi.url)
-            if size is not None and size > max_bytes:
-                skip += 1
-                logs.append(f"SKIP too large: {name} ({bytes_to_human(size)})")
-                continue
+        async def worker() -> None:
+            while True:
+                i, fi = await queue.get()
+                try:
+                    results[i] = await download_one(session, fi, out_root, settings)
+                except Exception as e:
+                    results[i] = ("fail", f"FAIL {fi.name}: {e}")
+                queue.task_done()
 
-            downloaded = 0
-            exceeded = False
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(settings.dl_concurrency, len(allowed))))]
+        try:
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
-            try:
-                async with session.get(fi.url, allow_redirects=True) as resp:
-                    resp.raise_for_status()
-                    async with aiofiles.open(out_path, "wb") as f:
-                        async for chunk in resp.content.iter_chunked(64 * 1024):
-                            if not chunk:
-                                continue
-                            downloaded += len(chunk)
-                            if downloaded > max_bytes:
-                                exceeded = True
-                                break
-                            await f.write(chunk)
-
-                if exceeded:
-                    try:
-                        out_path.unlink(missing_ok=True)
-                    except Exception:
-                        pass
-                    skip += 1
-                    logs.append(f"SKIP exceeded limit: {name}")
-                else:
-                    ok += 1
-                    logs.append(f"OK {name} ({bytes_to_human(downloaded)})")
-
-            except Exception as e:
-                try:
-                    out_path.unlink(missing_ok=True)
-                except Exception:
-                    pass
-                fail += 1
-                logs.append(f"FAIL {name}: {e}")
+        ok = sum(1 for status, _ in results if status == "ok")
+        skip = sum(1 for status, _ in results if status == "skip")
+        fail = len(results) - ok - skip
+        logs = [msg for _, msg in results]
 
         summary = (
             f"Allowed files: {len(allowed)}/{len(files)} | Downloaded: {ok} | Skipped: {skip} | Failed: {fail}\n"
@@ -422,8 +796,8 @@ async def mode_download(root_url: str, out_dir: str, settings: Settings) -> str:
         return summary + ("\n\n" + tail if tail else "")
 
 
-def parse_allow_ext(csv: str) -> set[str]:
-    return set(x.strip().lower().lstrip(".") for x in (csv or "").split(",") if x.strip())
+def parse_allow_ext(csv: str) -> frozenset[str]:
+    return frozenset(x.strip().lower().lstrip(".") for x in (csv or "").split(",") if x.strip())
 
 
 def build_settings(args: argparse.Namespace) -> Settings:
@@ -436,6 +810,8 @@ def build_settings(args: argparse.Namespace) -> Settings:
     max_files = int(args.max_files or os.getenv("MAX_FILES", "300"))
     max_depth = int(args.max_depth or os.getenv("MAX_DEPTH", "2"))
     timeout = int(args.timeout or os.getenv("TIMEOUT", "60"))
+    concurrency = int(args.concurrency or os.getenv("CONCURRENCY", "8"))
+    dl_concurrency = int(args.dl_concurrency or os.getenv("DL_CONCURRENCY", "4"))
 
     return Settings(
         tor_proxy=tor_proxy,
@@ -444,6 +820,8 @@ def build_settings(args: argparse.Namespace) -> Settings:
         max_files=max_files,
         max_depth=max_depth,
         timeout=timeout,
+        concurrency=concurrency,
+        dl_concurrency=dl_concurrency,
     )
 
 
@@ -459,6 +837,8 @@ async def main_async() -> int:
     p.add_argument("--max-files", default=None)
     p.add_argument("--max-depth", default=None)
     p.add_argument("--timeout", default=None)
+    p.add_argument("--concurrency", default=None)
+    p.add_argument("--dl-concurrency", dest="dl_concurrency", default=None)
     args = p.parse_args()
 
     if not is_onion_url(args.url):
@@ -472,14 +852,15 @@ async def main_async() -> int:
         return 3
 
     try:
-        if args.mode == "list":
-            out = await mode_list(args.url, settings, limit=50)
-        elif args.mode == "count":
-            out = await mode_count(args.url, args.ext, settings)
-        elif args.mode == "size":
-            out = await mode_size(args.url, settings)
-        else:
-            out = await mode_download(args.url, args.out, settings)
+        async with make_session(settings) as session:
+            if args.mode == "list":
+                out = await mode_list(args.url, settings, limit=50, session=session)
+            elif args.mode == "count":
+                out = await mode_count(args.url, args.ext, settings, session=session)
+            elif args.mode == "size":
+                out = await mode_size(args.url, settings, session=session)
+            else:
+                out = await mode_download(args.url, args.out, settings, session=session)
 
         print(out)
         return 0
@@ -489,6 +870,9 @@ async def main_async() -> int:
 
 
 def main():
+    # uvloop (libuv) dispatches socket callbacks faster than the default loop; optional
+    if uvloop is not None:
+        raise SystemExit(uvloop.run(main_async()))
     raise SystemExit(asyncio.run(main_async()))
 
 
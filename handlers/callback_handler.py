@@ -2,11 +2,22 @@
 import re
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from utils.scraper import fetch_gallery_metadata, build_image_url
+from utils.scraper import fetch_gallery_metadata, build_image_url, search_manga
 from utils.state_manager import get_user_state
-from aiohttp import ClientSession
+from handlers.search_handler import send_search_results
+from utils.http_client import get_http_session
 import aiofiles
 import asyncio
+from collections import OrderedDict
+
+# Barcha foydalanuvchilar uchun bitta rasm keshi (url -> bytes), LRU tartibida.
+# Hajm baytlarda cheklanadi, shuning uchun foydalanuvchilar soniga bog'liq emas
+IMAGE_CACHE_BYTES = 32 * 1024 * 1024
+IMAGE_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+_IMAGE_CACHE_BYTES = 0
+
+# Hozir oldindan yuklanayotgan rasmlar (url -> task); task'lar GC tomonidan yo'qolmasligi uchun ham kerak
+_PREFETCHING: dict = {}
 
 async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -28,7 +39,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         state.current_page = page
         results = await search_manga(term, page=page)
         state.search_results = results
-        await send_search_results(query, state, term)
+        await send_search_results(update, state, term)
         return
 
     # 2. Manga tanlash: select_manga:12345
@@ -39,8 +50,8 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         state.total_images = meta["total_images"]
         state.current_image_index = 0  # 0-indexed (1-rasm = index 0)
 
-        # Rasmlar URLlarini yaratamiz (barchasi uchun)
-        state.image_urls = [
+        # Rasmlar URLlarini bir marta yaratamiz (barchasi uchun); navigatsiya faqat indeks bo'yicha o'qiydi
+        state.image_urls = tuple(
             build_image_url(
                 gallery_id,
                 meta["folder"],
@@ -48,7 +59,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 i + 1  # 1-indexed
             )
             for i in range(meta["total_images"])
-        ]
+        )
 
         await send_image(update, state)
         return
@@ -87,29 +98,24 @@ async def send_image(update: Update, state):
 
     # Rasmni yuklab olish va yuborish (inline emas — to'g'ridan-to'g'ri photo)
     try:
-        async with ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    content = await resp.read()
-                    if update.callback_query:
-                        await update.callback_query.message.reply_photo(
-                            photo=content,
-                            caption=caption,
-                            reply_markup=InlineKeyboardMarkup(kb)
-                        )
-                        # Eski xabarni o'chirish (rasmga o'xshash emas)
-                        try:
-                            await update.callback_query.message.delete()
-                        except:
-                            pass
-                    else:
-                        await update.effective_message.reply_photo(
-                            photo=content,
-                            caption=caption,
-                            reply_markup=InlineKeyboardMarkup(kb)
-                        )
-                else:
-                    raise Exception(f"HTTP {resp.status}")
+        content = await get_image(url)
+        if update.callback_query:
+            await update.callback_query.message.reply_photo(
+                photo=content,
+                caption=caption,
+                reply_markup=InlineKeyboardMarkup(kb)
+            )
+            # Eski xabarni o'chirish (rasmga o'xshash emas)
+            try:
+                await update.callback_query.message.delete()
+            except:
+                pass
+        else:
+            await update.effective_message.reply_photo(
+                photo=content,
+                caption=caption,
+                reply_markup=InlineKeyboardMarkup(kb)
+            )
     except Exception as e:
         print(f"[IMG ERROR] {url} → {e}")
         fallback_msg = f"❌ Rasm yuklanmadi: `{url}`\nIltimos, boshqa manga tanlang."
@@ -117,3 +123,69 @@ async def send_image(update: Update, state):
             await update.callback_query.message.reply_text(fallback_msg, parse_mode="Markdown")
         else:
             await update.effective_message.reply_text(fallback_msg, parse_mode="Markdown")
+        return
+
+    # Foydalanuvchi o'qiyotgan paytda qo'shni rasmlarni oldindan yuklab qo'yamiz
+    for n in (idx + 1, idx - 1):
+        if 0 <= n < len(state.image_urls):
+            prefetch_image(state.image_urls[n])
+
+
+async def fetch_image(url: str) -> bytes:
+    # Umumiy sessiya: keyingi rasmlar ochiq ulanish orqali olinadi
+    session = get_http_session()
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            raise Exception(f"HTTP {resp.status}")
+        return await resp.read()
+
+
+def cache_image(url: str, content: bytes):
+    global _IMAGE_CACHE_BYTES
+    if len(content) > IMAGE_CACHE_BYTES:
+        return
+    old = IMAGE_CACHE.pop(url, None)
+    if old is not None:
+        _IMAGE_CACHE_BYTES -= len(old)
+    IMAGE_CACHE[url] = content
+    _IMAGE_CACHE_BYTES += len(content)
+    while _IMAGE_CACHE_BYTES > IMAGE_CACHE_BYTES:
+        _, evicted = IMAGE_CACHE.popitem(last=False)
+        _IMAGE_CACHE_BYTES -= len(evicted)
+
+
+async def get_image(url: str) -> bytes:
+    content = IMAGE_CACHE.get(url)
+    if content is not None:
+        IMAGE_CACHE.move_to_end(url)
+        return content
+    # Oldindan yuklash davom etayotgan bo'lsa, o'shani kutamiz (ikkinchi so'rov yubormaymiz)
+    task = _PREFETCHING.get(url)
+    if task is not None:
+        try:
+            content = await asyncio.shield(task)
+        except Exception:
+            content = None
+        if content is not None:
+            return content
+    content = await fetch_image(url)
+    cache_image(url, content)
+    return content
+
+
+def prefetch_image(url: str):
+    if url in IMAGE_CACHE or url in _PREFETCHING:
+        return
+
+    async def run():
+        try:
+            content = await fetch_image(url)
+            cache_image(url, content)
+            return content
+        except Exception as e:
+            print(f"[PREFETCH] {url} → {e}")
+            return None
+        finally:
+            _PREFETCHING.pop(url, None)
+
+    _PREFETCHING[url] = asyncio.create_task(run())
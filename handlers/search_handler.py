@@ -2,7 +2,7 @@
 import re
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from utils.scraper import search_manga
+from utils.scraper import search_manga, prefetch_search
 from utils.state_manager import get_user_state
 
 async def search_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -45,3 +45,7 @@ async def send_search_results(update: Update, state, term: str):
         await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
     else:
         await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(kb), parse_mode="Markdown")
+
+    # Keyingi sahifa bo'lishi mumkin: foydalanuvchi o'qiyotganda uni oldindan yuklaymiz
+    if len(state.search_results) == 10:
+        prefetch_search(term, state.current_page + 1)
@@ -1,15 +1,26 @@
 import asyncio
 import os
 import re
+import shutil
+import sqlite3
 import sys
 import tempfile
+import time
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import aiohttp
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.default import DefaultBotProperties
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, Message
+
+try:
+    import uvloop
+except Exception:
+    uvloop = None
 
 # =========================
 # Dynamic import (filename contains '-')
@@ -41,18 +52,36 @@ ALLOWED_EXT = os.getenv("ALLOWED_EXT", "pdf,txt,jpg,jpeg,png,zip,mp4,mkv,avi,web
 MAX_FILES = int(os.getenv("MAX_FILES", "300"))
 MAX_DEPTH = int(os.getenv("MAX_DEPTH", "2"))
 TIMEOUT = int(os.getenv("TIMEOUT", "60"))
+CONCURRENCY = int(os.getenv("CONCURRENCY", "8"))
+DL_CONCURRENCY = int(os.getenv("DL_CONCURRENCY", "4"))
+# jobs processed at the same time (each job still respects CONCURRENCY / DL_CONCURRENCY)
+WORKERS = max(1, int(os.getenv("WORKERS", "3")))
+# /download jobs get their own workers so they never hold up quick list/size/count jobs
+DL_WORKERS = max(1, int(os.getenv("DL_WORKERS", "2")))
 
 DOWNLOAD_ROOT = os.getenv("DOWNLOAD_ROOT", "/tmp/dw_downloads").strip()
+# queued jobs survive a restart: they are re-queued from this SQLite file on startup
+JOBS_DB = os.getenv("JOBS_DB", "dw_jobs.sqlite3").strip()
 
-ONION_RE = re.compile(r"^https?://[a-z2-7]{16,56}\.onion(?:/.*)?$", re.I)
+# re.A: with re.I alone, [a-z] would also accept non-ASCII case variants (e.g. the Kelvin sign)
+ONION_RE = re.compile(r"https?://[a-z2-7]{16,56}\.onion(?:/.*)?", re.I | re.A)
 
 
 def is_onion(url: str) -> bool:
-    return bool(ONION_RE.match(url.strip()))
+    # callers pass an already stripped url (see parse_command)
+    return ONION_RE.fullmatch(url) is not None
+
 
+def parse_command(text: Optional[str]) -> tuple[str, list[str]]:
+    # "/cmd <url> [args...]" -> (url, args); split() already drops surrounding whitespace
+    parts = (text or "").split()
+    return (parts[1] if len(parts) >= 2 else ""), parts[2:]
 
+
+# env is read once at import, so every job can share one Settings instance
+@lru_cache(maxsize=1)
 def build_settings() -> "dwd.Settings":
-    allow = set(x.strip().lower().lstrip(".") for x in ALLOWED_EXT.split(",") if x.strip())
+    allow = frozenset(x.strip().lower().lstrip(".") for x in ALLOWED_EXT.split(",") if x.strip())
     return dwd.Settings(
         tor_proxy=TOR_PROXY,
         max_mb=MAX_MB,
@@ -60,6 +89,10 @@ def build_settings() -> "dwd.Settings":
         max_files=MAX_FILES,
         max_depth=MAX_DEPTH,
         timeout=TIMEOUT,
+        concurrency=CONCURRENCY,
+        dl_concurrency=DL_CONCURRENCY,
+        # all jobs share one session: every crawl worker plus every ranged download part at once
+        conn_limit=WORKERS * CONCURRENCY + DL_WORKERS * DL_CONCURRENCY * dwd.RANGE_PARTS,
     )
 
 
@@ -72,44 +105,142 @@ class Job:
     mode: str
     url: str
     ext: Optional[str] = None
+    id: Optional[int] = None
 
 
 queue: asyncio.Queue[Job] = asyncio.Queue()
+dl_queue: asyncio.Queue[Job] = asyncio.Queue()
 dp = Dispatcher()
 
+# single-row writes in WAL mode with synchronous=NORMAL take well under a millisecond,
+# so they run inline on the event loop
+db = sqlite3.connect(JOBS_DB, isolation_level=None)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.execute(
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id INTEGER PRIMARY KEY, chat_id INTEGER, mode TEXT, url TEXT, ext TEXT, "
+    "state TEXT NOT NULL DEFAULT 'pending', created_at REAL)"
+)
 
-async def worker(bot: Bot):
-    while True:
-        job = await queue.get()
-        try:
-            settings = build_settings()
 
-            if job.mode == "list":
-                result = await dwd.mode_list(job.url, settings, limit=50)
-                await bot.send_message(job.chat_id, f"✅\n{result}")
+def set_job_state(job: Job, state: str):
+    if job.id is not None:
+        db.execute("UPDATE jobs SET state = ? WHERE id = ?", (state, job.id))
+
+
+def finish_job(job: Job):
+    # finished jobs are not needed for restore; deleting them keeps the table at the size of the backlog
+    if job.id is not None:
+        db.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+
+def queue_for(job: Job) -> asyncio.Queue[Job]:
+    return dl_queue if job.mode == "download" else queue
+
+
+# (mode, url, ext) -> every job waiting on that crawl; the first one is the job actually queued
+inflight: dict[tuple, list[Job]] = {}
+
+
+def add_job(job: Job) -> bool:
+    # True if the job has to be queued; False if it joined an identical job already in flight
+    key = (job.mode, job.url, job.ext)
+    waiting = inflight.get(key)
+    if waiting is not None:
+        waiting.append(job)
+        return False
+    inflight[key] = [job]
+    return True
+
 
-            elif job.mode == "size":
-                result = await dwd.mode_size(job.url, settings)
-                await bot.send_message(job.chat_id, f"✅\n{result}")
+async def enqueue(job: Job):
+    cur = db.execute(
+        "INSERT INTO jobs (chat_id, mode, url, ext, created_at) VALUES (?, ?, ?, ?, ?)",
+        (job.chat_id, job.mode, job.url, job.ext, time.time()),
+    )
+    job.id = cur.lastrowid
+    if add_job(job):
+        await queue_for(job).put(job)
+
+
+def restore_jobs():
+    # jobs that were waiting or running when the bot stopped
+    rows = db.execute(
+        "SELECT id, chat_id, mode, url, ext FROM jobs WHERE state IN ('pending', 'running') ORDER BY id"
+    ).fetchall()
+    for id_, chat_id, mode, url, ext in rows:
+        job = Job(chat_id=chat_id, mode=mode, url=url, ext=ext, id=id_)
+        if add_job(job):
+            queue_for(job).put_nowait(job)
+    return len(rows)
+
+
+# Telegram rejects text messages longer than this
+MAX_MESSAGE_LEN = 4096
+
+
+async def send_result(bot: Bot, chat_id: int, text: str):
+    # long reports (big listings, download logs) go out as a plain-text document instead of failing
+    if len(text) <= MAX_MESSAGE_LEN:
+        await bot.send_message(chat_id, text)
+        return
+    await bot.send_document(
+        chat_id,
+        BufferedInputFile(text.encode("utf-8"), filename="result.txt"),
+        caption=text.split("\n", 1)[0][:200],
+    )
+
+
+async def run_job(job: Job, session: aiohttp.ClientSession) -> str:
+    settings = build_settings()
 
-            elif job.mode == "count":
-                result = await dwd.mode_count(job.url, job.ext, settings)
-                await bot.send_message(job.chat_id, f"✅\n{result}")
+    if job.mode == "list":
+        result = await dwd.mode_list(job.url, settings, limit=50, session=session)
+        return f"✅\n{result}"
 
-            elif job.mode == "download":
-                Path(DOWNLOAD_ROOT).mkdir(parents=True, exist_ok=True)
-                with tempfile.TemporaryDirectory(prefix="dwjob_", dir=DOWNLOAD_ROOT) as tmpdir:
-                    result = await dwd.mode_download(job.url, tmpdir, settings)
-                    await bot.send_message(job.chat_id, f"✅ Download done\n{result}")
+    if job.mode == "size":
+        result = await dwd.mode_size(job.url, settings, session=session)
+        return f"✅\n{result}"
+
+    if job.mode == "count":
+        result = await dwd.mode_count(job.url, job.ext, settings, session=session)
+        return f"✅\n{result}"
+
+    if job.mode == "download":
+        Path(DOWNLOAD_ROOT).mkdir(parents=True, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(prefix="dwjob_", dir=DOWNLOAD_ROOT)
+        try:
+            result = await dwd.mode_download(job.url, tmpdir, settings, session=session)
+            return f"✅ Download done\n{result}"
+        finally:
+            # removing hundreds of files would block the event loop; do it in the background
+            # so the worker can take the next job right away
+            asyncio.get_running_loop().run_in_executor(None, shutil.rmtree, tmpdir, True)
 
-            else:
-                await bot.send_message(job.chat_id, "❌ Unknown mode")
+    return "❌ Unknown mode"
 
+
+async def worker(bot: Bot, session: aiohttp.ClientSession, queue: asyncio.Queue[Job]):
+    while True:
+        job = await queue.get()
+        set_job_state(job, "running")
+        try:
+            text = await run_job(job, session)
         except Exception as e:
-            await bot.send_message(job.chat_id, f"❌ Error: {e}")
+            text = f"❌ Error: {e}"
         finally:
             queue.task_done()
 
+        # not reached on cancellation: a job interrupted by shutdown stays 'running' and is restored.
+        # Everyone who asked for the same crawl while it ran gets this one result.
+        for j in inflight.pop((job.mode, job.url, job.ext), [job]):
+            try:
+                await send_result(bot, j.chat_id, text)
+            except Exception as e:
+                print(f"[SEND ERROR] chat {j.chat_id}: {e}")
+            finish_job(j)
+
 
 @dp.message(Command("start"))
 async def start_cmd(m: Message):
@@ -130,38 +261,38 @@ async def start_cmd(m: Message):
 
 @dp.message(Command("list"))
 async def list_cmd(m: Message):
-    parts = (m.text or "").split(maxsplit=1)
-    if len(parts) < 2 or not is_onion(parts[1]):
+    url, _ = parse_command(m.text)
+    if not is_onion(url):
         return await m.answer("Misol: /list http://xxxx.onion/path/")
-    await queue.put(Job(chat_id=m.chat.id, mode="list", url=parts[1].strip()))
+    await enqueue(Job(chat_id=m.chat.id, mode="list", url=url))
     await m.answer("✅ Queuega qo‘shildi (list).")
 
 
 @dp.message(Command("size"))
 async def size_cmd(m: Message):
-    parts = (m.text or "").split(maxsplit=1)
-    if len(parts) < 2 or not is_onion(parts[1]):
+    url, _ = parse_command(m.text)
+    if not is_onion(url):
         return await m.answer("Misol: /size http://xxxx.onion/path/")
-    await queue.put(Job(chat_id=m.chat.id, mode="size", url=parts[1].strip()))
+    await enqueue(Job(chat_id=m.chat.id, mode="size", url=url))
     await m.answer("✅ Queuega qo‘shildi (size).")
 
 
 @dp.message(Command("count"))
 async def count_cmd(m: Message):
-    parts = (m.text or "").split()
-    if len(parts) < 2 or not is_onion(parts[1]):
+    url, args = parse_command(m.text)
+    if not is_onion(url):
         return await m.answer("Misol: /count http://xxxx.onion/path/ mp4")
-    ext = parts[2].strip().lower().lstrip(".") if len(parts) >= 3 else None
-    await queue.put(Job(chat_id=m.chat.id, mode="count", url=parts[1].strip(), ext=ext))
+    ext = args[0].lower().lstrip(".") if args else None
+    await enqueue(Job(chat_id=m.chat.id, mode="count", url=url, ext=ext))
     await m.answer("✅ Queuega qo‘shildi (count).")
 
 
 @dp.message(Command("download"))
 async def download_cmd(m: Message):
-    parts = (m.text or "").split(maxsplit=1)
-    if len(parts) < 2 or not is_onion(parts[1]):
+    url, _ = parse_command(m.text)
+    if not is_onion(url):
         return await m.answer("Misol: /download http://xxxx.onion/path/")
-    await queue.put(Job(chat_id=m.chat.id, mode="download", url=parts[1].strip()))
+    await enqueue(Job(chat_id=m.chat.id, mode="download", url=url))
     await m.answer("✅ Queuega qo‘shildi (download).")
 
 
@@ -170,16 +301,35 @@ async def onion_auto(m: Message):
     text = (m.text or "").strip()
     if is_onion(text):
         # default: direct links list
-        await queue.put(Job(chat_id=m.chat.id, mode="list", url=text))
+        await enqueue(Job(chat_id=m.chat.id, mode="list", url=text))
         return await m.answer("✅ Onion link qabul qilindi. Direct linklar olinmoqda (/list).")
     await m.answer("Onion link yubor yoki /start.")
 
 
 async def main():
-    bot = Bot(BOT_TOKEN)
-    asyncio.create_task(worker(bot))
-    await dp.start_polling(bot)
+    # results are full of .onion links Telegram cannot preview anyway; skip the preview lookup
+    bot = Bot(BOT_TOKEN, default=DefaultBotProperties(link_preview_is_disabled=True))
+    # one Tor session for the bot's lifetime: jobs reuse pooled keep-alive connections
+    # instead of paying a fresh SOCKS handshake per job
+    restored = restore_jobs()
+    if restored:
+        print(f"Restored {restored} unfinished job(s) from {JOBS_DB}")
+    async with dwd.make_session(build_settings()) as session:
+        # several workers so one user's long /download does not block everyone else's jobs;
+        # keep references so the tasks are not garbage-collected
+        workers = [asyncio.create_task(worker(bot, session, queue)) for _ in range(WORKERS)]
+        workers += [asyncio.create_task(worker(bot, session, dl_queue)) for _ in range(DL_WORKERS)]
+        try:
+            await dp.start_polling(bot)
+        finally:
+            # stop workers before the shared session is closed
+            for t in workers:
+                t.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
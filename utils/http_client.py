@@ -0,0 +1,14 @@
+# utils/http_client.py
+from typing import Optional
+from aiohttp import ClientSession, TCPConnector
+
+# Umumiy aiohttp sessiyasi: har bir so'rov uchun yangi ulanish ochilmaydi,
+# keep-alive ulanishlar qayta ishlatiladi
+_SESSION: Optional[ClientSession] = None
+
+def get_http_session() -> ClientSession:
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        connector = TCPConnector(limit=32, limit_per_host=8, keepalive_timeout=60, ttl_dns_cache=300)
+        _SESSION = ClientSession(connector=connector)
+    return _SESSION
@@ -1,33 +1,156 @@
 # utils/scraper.py
-import requests
-from bs4 import BeautifulSoup
+from aiohttp import ClientError, ClientResponseError, ClientTimeout
+from selectolax.lexbor import LexborHTMLParser
+from collections import OrderedDict
+from contextlib import nullcontext
 from urllib.parse import urljoin, quote
+import asyncio
+import codecs
+import os
 import re
+import string
+import time
 from config import BASE_URL, SEARCH_URL, GALLERY_URL, IMAGE_BASE_URL
+from utils.http_client import get_http_session
+
+try:
+    from aiolimiter import AsyncLimiter
+except Exception:
+    AsyncLimiter = None
+
+# Har bir so'rov uchun umumiy vaqt chegarasi (soniya)
+REQUEST_TIMEOUT = ClientTimeout(total=10)
+# Galereya sahifasi shu o'lchamdagi bo'laklarda o'qiladi
+STREAM_CHUNK = 16 * 1024
+# Bo'laklar chegarasida qolib ketgan marker ham topilishi uchun oldingi qismdan shuncha belgi qo'shiladi
+MARKER_OVERLAP = 1024
+
+# Vaqtinchalik xatolarda (uzilish, timeout, 5xx/429) qayta urinish: 0.2s, 0.4s ... ko'pi bilan 2s kutiladi
+FETCH_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+
+# Saytga soniyasiga ko'pi bilan shuncha so'rov: 429 olib qayta urinishdan ko'ra oldindan sekinlatgan yaxshi
+SCRAPER_RATE = float(os.getenv("SCRAPER_RATE", "10"))
+LIMITER = AsyncLimiter(SCRAPER_RATE, 1) if AsyncLimiter and SCRAPER_RATE > 0 else nullcontext()
+
+# Regexlar bir marta, modul yuklanganda kompilyatsiya qilinadi
+GID_RE = re.compile(r"/g/(\d+)/")
+TOTAL_RE = re.compile(r"\d+/(\d+)")
+FOLDER_RE = re.compile(r'gallery_folder\s*=\s*"([^"]+)"')
+SUBFOLDER_RE = re.compile(r'gallery_subfolder\s*=\s*"([^"]+)"')
+# quote() hech narsani o'zgartirmaydigan belgilar
+SLUG_SAFE = frozenset(string.ascii_lowercase + string.digits + "-")
+
+# Galereya ma'lumotlari (rasm soni, folder) o'zgarmaydi: gallery_id bo'yicha keshlaymiz
+GALLERY_CACHE_TTL = 3600
+GALLERY_CACHE_SIZE = 4096
+GALLERY_CACHE: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+# Qidiruv sahifalari (term, page) bo'yicha qisqa muddat saqlanadi; keyingi sahifa oldindan yuklanadi
+SEARCH_CACHE_TTL = 300
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE: "OrderedDict[tuple[str, int], tuple[float, list]]" = OrderedDict()
+SEARCH_PENDING: dict = {}
+
+# <div class="pagination"><span>1/15</span> — sahifalash hisoblagichi
+PAGINATION_RE = re.compile(
+    r'<div[^>]*\bclass="[^"]*\bpagination\b[^"]*"[^>]*>\s*<span[^>]*>\s*\d+\s*/\s*(\d+)\s*<', re.I
+)
+
+# Galereya sahifasida kerakli hamma narsa: bular topilgach sahifaning qolgani o'qilmaydi
+GALLERY_MARKERS = (FOLDER_RE, SUBFOLDER_RE, PAGINATION_RE)
+
+def is_transient(e: Exception) -> bool:
+    if isinstance(e, ClientResponseError):
+        return e.status == 429 or e.status >= 500
+    return isinstance(e, (ClientError, asyncio.TimeoutError))
+
+async def read_until(res, markers) -> str:
+    # Javobni bo'laklab o'qiymiz; hamma markerlar topilishi bilan to'xtab, qolganini yuklamaymiz.
+    # Har bir marker bir marta topiladi va faqat yangi kelgan qism (+ MARKER_OVERLAP) ichida qidiriladi,
+    # shuning uchun sahifa bo'yicha ish chiziqli qoladi.
+    # Eslatma: erta to'xtaganda res.close() ulanishni yopadi (keep-alive'ga qaytmaydi) —
+    # qolgan tanani oxirigacha o'qishdan ko'ra bitta ulanishni qayta ochish arzonroq.
+    decoder = codecs.getincrementaldecoder(res.charset or "utf-8")(errors="replace")
+    parts = []
+    pending = list(markers)
+    tail = ""
+    async for chunk in res.content.iter_chunked(STREAM_CHUNK):
+        piece = decoder.decode(chunk)
+        parts.append(piece)
+        window = tail + piece
+        pending = [m for m in pending if not m.search(window)]
+        if not pending:
+            res.close()
+            return "".join(parts)
+        tail = window[-MARKER_OVERLAP:]
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+async def fetch_html(url: str, until=None) -> str:
+    # Umumiy aiohttp sessiyasi: event loop bloklanmaydi, ulanishlar qayta ishlatiladi.
+    # until (regexlar) berilsa, ularning hammasi topilgan zahoti o'qish to'xtatiladi
+    session = get_http_session()
+    for attempt in range(FETCH_ATTEMPTS):
+        try:
+            async with LIMITER:
+                async with session.get(url, timeout=REQUEST_TIMEOUT) as res:
+                    res.raise_for_status()
+                    if until:
+                        return await read_until(res, until)
+                    return await res.text()
+        except Exception as e:
+            if attempt + 1 >= FETCH_ATTEMPTS or not is_transient(e):
+                raise
+            await asyncio.sleep(min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY))
 
 def safe_slug(term: str) -> str:
-    return quote(term.lower().replace(" ", "-"))
+    slug = term.lower().replace(" ", "-")
+    # Ko'p hollarda slug faqat a-z0-9- dan iborat: quote() ga hojat yo'q
+    return slug if SLUG_SAFE.issuperset(slug) else quote(slug)
 
 async def search_manga(term: str, page: int = 1) -> list:
+    key = (term, page)
+    cached = SEARCH_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < SEARCH_CACHE_TTL:
+        return list(cached[1])
+    # Oldindan yuklash ketayotgan bo'lsa, o'sha so'rovni kutamiz
+    task = SEARCH_PENDING.get(key)
+    if task is not None:
+        return list(await asyncio.shield(task))
+    return await load_search_page(term, page)
+
+def prefetch_search(term: str, page: int):
+    # Foydalanuvchi joriy sahifani ko'rayotganda keyingisini fonda yuklab qo'yamiz
+    key = (term, page)
+    cached = SEARCH_CACHE.get(key)
+    if (cached and time.monotonic() - cached[0] < SEARCH_CACHE_TTL) or key in SEARCH_PENDING:
+        return
+    task = asyncio.create_task(load_search_page(term, page))
+    SEARCH_PENDING[key] = task
+    task.add_done_callback(lambda _: SEARCH_PENDING.pop(key, None))
+
+async def load_search_page(term: str, page: int) -> list:
     url = SEARCH_URL.format(slug=safe_slug(term), page=page)
     try:
-        res = requests.get(url, timeout=10)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, "lxml")
+        html = await fetch_html(url)
+        # selectolax (lexbor): BeautifulSoup'dan ancha tez, faqat kerakli tugunlarni o'qiymiz
+        tree = LexborHTMLParser(html)
 
         items = []
-        for div in soup.select("div.manga-card"):
-            a_tag = div.select_one("a.title")
+        for div in tree.css("div.manga-card"):
+            a_tag = div.css_first("a.title")
             if not a_tag:
                 continue
 
-            title = a_tag.get_text(strip=True) or "No Title"
-            href = a_tag.get("href", "")
+            title = a_tag.text(strip=True) or "No Title"
+            href = a_tag.attributes.get("href") or ""
             if not href.startswith("/g/"):
                 continue
 
             # href: /g/12345/ → gallery_id = 12345
-            match = re.search(r"/g/(\d+)/", href)
+            match = GID_RE.search(href)
             if not match:
                 continue
             gallery_id = match.group(1)
@@ -37,26 +160,35 @@ async def search_manga(term: str, page: int = 1) -> list:
                 "gallery_id": gallery_id,
                 "url": urljoin(BASE_URL, href)
             })
-        return items
+        if items:
+            SEARCH_CACHE[(term, page)] = (time.monotonic(), items)
+            while len(SEARCH_CACHE) > SEARCH_CACHE_SIZE:
+                SEARCH_CACHE.popitem(last=False)
+        return list(items)
     except Exception as e:
         print(f"[SCRAPER] Search error: {e}")
         return []
 
 async def fetch_gallery_metadata(gallery_id: str) -> dict:
+    cached = GALLERY_CACHE.get(gallery_id)
+    if cached and time.monotonic() - cached[0] < GALLERY_CACHE_TTL:
+        GALLERY_CACHE.move_to_end(gallery_id)
+        return dict(cached[1])
+
     url = GALLERY_URL.format(gallery_id=gallery_id)
     try:
-        res = requests.get(url, timeout=10)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.text, "lxml")
+        html = await fetch_html(url, until=GALLERY_MARKERS)
 
-        # Rasmlar sonini aniqlash (1/15 degani 15 ta rasm bor)
-        counter = soup.select_one("div.pagination > span")
+        # Rasmlar sonini aniqlash (1/15 degani 15 ta rasm bor).
+        # Avval xom HTML ustida bitta regex; topilmasa (markup boshqacha bo'lsa) HTML parse qilinadi
         total = 1
-        if counter:
-            text = counter.get_text(strip=True)
-            match = re.search(r"\d+/(\d+)", text)
-            if match:
-                total = int(match.group(1))
+        match = PAGINATION_RE.search(html)
+        if not match:
+            counter = LexborHTMLParser(html).css_first("div.pagination > span")
+            if counter:
+                match = TOTAL_RE.search(counter.text(strip=True))
+        if match:
+            total = int(match.group(1))
 
         # Rasmlar papkasini HTML dan olish — masalan: <img src="https://pics.hentai.name/a/b/12345/001.webp">
         # Biroq to'g'ridan-to'g'ri src dan olish yoki JS qilish kerak.
@@ -64,24 +196,27 @@ async def fetch_gallery_metadata(gallery_id: str) -> dict:
 
         # Ma'lumotlar olish uchun HTML dan folder/subfolder topish:
         # Masalan: <script>...gallery_folder = "a"; gallery_subfolder = "b";...</script>
-        script = soup.find("script", string=re.compile(r"gallery_folder"))
+        # Bu qatorlar faqat o'sha scriptda uchraydi, shuning uchun to'g'ridan-to'g'ri HTML ustida qidiramiz
         folder = "a"
         subfolder = "b"
-        if script:
-            text = script.string
-            folder_match = re.search(r'gallery_folder\s*=\s*"([^"]+)"', text)
-            subfolder_match = re.search(r'gallery_subfolder\s*=\s*"([^"]+)"', text)
-            if folder_match:
-                folder = folder_match.group(1)
-            if subfolder_match:
-                subfolder = subfolder_match.group(1)
+        folder_match = FOLDER_RE.search(html)
+        subfolder_match = SUBFOLDER_RE.search(html)
+        if folder_match:
+            folder = folder_match.group(1)
+        if subfolder_match:
+            subfolder = subfolder_match.group(1)
 
-        return {
+        meta = {
             "gallery_id": gallery_id,
             "total_images": total,
             "folder": folder,
             "subfolder": subfolder,
         }
+        # Faqat muvaffaqiyatli natija keshlanadi (xato holatidagi default qiymatlar emas)
+        GALLERY_CACHE[gallery_id] = (time.monotonic(), meta)
+        while len(GALLERY_CACHE) > GALLERY_CACHE_SIZE:
+            GALLERY_CACHE.popitem(last=False)
+        return dict(meta)
     except Exception as e:
         print(f"[SCRAPER] Gallery fetch error for {gallery_id}: {e}")
         return {
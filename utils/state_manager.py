@@ -1,11 +1,22 @@
 # utils/state_manager.py
-from typing import Dict, Optional, List
+import time
+from collections import OrderedDict
+from typing import Optional, List, Tuple
 
-# Oddiy in-memory state (chat_id -> dict)
+# Oddiy in-memory state (chat_id -> UserState), oxirgi foydalanish tartibida
 # Real loyihada Redis yoki DB ishlatish kerak
-USER_STATES: Dict[int, dict] = {}
+USER_STATES: "OrderedDict[int, UserState]" = OrderedDict()
+
+# Xotira chegarasi: shuncha vaqt (soniya) ishlatilmagan yoki limitdan ortiq eski state'lar o'chiriladi
+STATE_TTL = 3600
+MAX_USER_STATES = 10000
 
 class UserState:
+    __slots__ = (
+        "chat_id", "search_results", "current_page", "current_gallery",
+        "current_image_index", "total_images", "image_urls", "last_used",
+    )
+
     def __init__(self, chat_id: int):
         self.chat_id = chat_id
         self.search_results: List[dict] = []
@@ -13,12 +24,27 @@ class UserState:
         self.current_gallery: Optional[dict] = None
         self.current_image_index: int = 0
         self.total_images: int = 0
-        self.image_urls: List[str] = []
+        self.image_urls: Tuple[str, ...] = ()
+        self.last_used: float = time.monotonic()
+
+def evict_user_states(now: float):
+    # Eng eski state'lar boshida turadi: muddati o'tganlarini va limitdan ortig'ini olib tashlaymiz
+    while USER_STATES:
+        chat_id, state = next(iter(USER_STATES.items()))
+        if now - state.last_used < STATE_TTL and len(USER_STATES) <= MAX_USER_STATES:
+            break
+        del USER_STATES[chat_id]
 
 def get_user_state(chat_id: int) -> UserState:
-    if chat_id not in USER_STATES:
-        USER_STATES[chat_id] = UserState(chat_id)
-    return USER_STATES[chat_id]
+    now = time.monotonic()
+    state = USER_STATES.get(chat_id)
+    if state is None:
+        state = USER_STATES[chat_id] = UserState(chat_id)
+    else:
+        USER_STATES.move_to_end(chat_id)
+    state.last_used = now
+    evict_user_states(now)
+    return state
 
 def clear_user_state(chat_id: int):
     USER_STATES.pop(chat_id, None)